@@ -3,35 +3,303 @@ A speech dataset generation tool.
 This tool automagically generates and records sentences for use in speech datasets.
 '''
 
+import os
 import re
+import csv
 import sys
 import math
-import glob
+import mmap
 import wave
 import random
+from bisect import bisect_right
+import numpy as np
 import pyaudio
-from PySide2.QtCore import Qt, Slot, QTimer
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PySide2.QtCore import Qt, Slot, QTimer, QAbstractTableModel, QModelIndex
 from PySide2.QtGui import QPainter
 from PySide2.QtWidgets import (QAction, QApplication, QHeaderView, QHBoxLayout, QLabel, QLineEdit,
-                               QMainWindow, QPushButton, QTableWidget, QTableWidgetItem, QListWidget,
-                               QListWidgetItem, QVBoxLayout, QWidget, QGroupBox, QSizePolicy, QFileDialog, QProgressDialog)
+                               QMainWindow, QPushButton, QTableView, QListWidget,
+                               QListWidgetItem, QVBoxLayout, QWidget, QGroupBox, QSizePolicy, QFileDialog, QProgressDialog,
+                               QMessageBox)
 from pathlib import Path
 from pydub import AudioSegment
 
-def natural_keys(text):
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional, silence is then detected with plain NumPy
+    njit = None
+
+# Large buffers coalesce reads and writes of multi-MB recordings and long transcripts into few syscalls
+IO_BUFFER_SIZE = 1 << 20
+
+_NUM_SPLIT = re.compile(r'(\d+)').split
+
+def natural_keys(text, _split=_NUM_SPLIT):
     '''
     alist.sort(key=natural_keys) sorts in human order
     Source: https://stackoverflow.com/a/5967539/7614083
     '''
-    return [(int(c) if c.isdigit() else c) for c in re.split(r'(\d+)', text)]
+    return [(int(c) if c.isdigit() else c) for c in _split(text)]
+
+def natural_sorted(paths):
+    '''
+    Sorts paths in human order of their file names.
+    Every key is computed once up front and the (key, path) pairs are sorted directly.
+    '''
+    keyed = [(natural_keys(os.path.basename(path)), path) for path in paths]
+    keyed.sort()
+    return [path for _, path in keyed]
+
+def read_transcript_map(transcript_file_path):
+    '''
+    Reads a 'recording_id|transcription' metadata.csv into a {recording_id: transcription} dict.
+    '''
+    def read(encoding, errors='strict'):
+        # QUOTE_NONE keeps any quotes in the transcriptions as they were written
+        with open(transcript_file_path, 'r', encoding=encoding, errors=errors, buffering=IO_BUFFER_SIZE, newline='') as transcript_file:
+            reader = csv.reader(transcript_file, delimiter='|', quoting=csv.QUOTE_NONE)
+            # Anything after a second '|' (e.g. LJSpeech's normalized text) stays part of the transcription,
+            # so that it survives the CSV being rewritten
+            return {str(Path(row[0].strip())): '|'.join(row[1:]).strip() for row in reader if len(row) >= 2 and row[0].strip()}
+
+    try:
+        return read('utf-8')
+    except UnicodeDecodeError:
+        # Older datasets were written in the locale encoding (e.g. cp1252 on Windows), they are rewritten as UTF-8.
+        # Bytes that don't fit it either are replaced rather than making the dataset impossible to load
+        return read(None, errors='replace')
+
+def wav_entries(directory):
+    '''
+    Yields the path of every .wav file in directory, streaming entries as they are read.
+    scandir already knows which entries are files, so no extra stat calls are made.
+    '''
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith('.wav') and entry.is_file(): yield entry.path
 
-def detect_leading_silence(sound, silence_threshold=-40.0, chunk_size=10):
-    trim_ms = 0
+def samples_per_chunk(frame_rate, channels, chunk_size=10):
+    '''
+    Returns the number of interleaved samples in one chunk_size ms chunk.
+    '''
     assert chunk_size > 0
-    while sound[trim_ms:trim_ms+chunk_size].dBFS < silence_threshold and trim_ms < len(sound):
-        trim_ms += chunk_size
+    return max(1, int(frame_rate * chunk_size / 1000)) * channels
+
+def samples_sum_sq(samples, chunk_samples):
+    '''
+    Returns the sum of squared samples of every full chunk of chunk_samples interleaved samples, as a NumPy array.
+    '''
+    n_chunks = len(samples) // chunk_samples
+    frames = samples[:n_chunks * chunk_samples].reshape(-1, chunk_samples).astype(np.float64)
+    return (frames * frames).sum(axis=1)
+
+def threshold_sum_sq(chunk_samples, max_amplitude, silence_threshold=-40.0):
+    '''
+    Returns the sum of squared samples at which a chunk of chunk_samples samples reaches silence_threshold dBFS.
+    Comparing against this is the same as comparing the chunk's dBFS, without any log10.
+    '''
+    return (max_amplitude * 10 ** (silence_threshold / 20)) ** 2 * chunk_samples
+
+if njit is not None:
+    # Kept serial: trim_silence already runs one file per thread pool worker, and Numba's default
+    # workqueue threading layer aborts when parallel kernels are entered from several threads at once
+    @njit(cache=True, fastmath=True)
+    def _loud_chunk_bounds(samples, samples_per_chunk, threshold_sq):
+        '''
+        Returns (number of chunks, first loud chunk, last loud chunk), with -1 if no chunk is loud.
+        A chunk is loud when its sum of squared samples reaches threshold_sq.
+        '''
+        n_chunks = samples.size // samples_per_chunk
+        loud = np.zeros(n_chunks, dtype=np.bool_)
+        for i in range(n_chunks):
+            offset = i * samples_per_chunk
+            sum_sq = 0.0
+            for j in range(samples_per_chunk):
+                v = float(samples[offset + j])
+                sum_sq += v * v
+            loud[i] = sum_sq >= threshold_sq
+
+        first = -1
+        for i in range(n_chunks):
+            if loud[i]:
+                first = i
+                break
+        last = -1
+        for i in range(n_chunks - 1, -1, -1):
+            if loud[i]:
+                last = i
+                break
+        return n_chunks, first, last
+
+def loud_frame_bounds(samples, frame_rate, channels, max_amplitude, silence_threshold=-40.0, chunk_size=10):
+    '''
+    Returns the (start, end) frame offsets of interleaved integer samples once the leading and trailing silence
+    is cut off, from a single scan. The offsets fall on chunk boundaries, so they can be sliced with directly.
+    '''
+    chunk_samples = samples_per_chunk(frame_rate, channels, chunk_size)
+    threshold_sq = threshold_sum_sq(chunk_samples, max_amplitude, silence_threshold)
+    if njit is None:
+        loud = samples_sum_sq(samples, chunk_samples) >= threshold_sq
+        n_chunks = len(loud)
+        first = int(np.argmax(loud)) if loud.any() else -1
+        last = n_chunks - 1 - int(np.argmax(loud[::-1])) if first >= 0 else -1
+    else:
+        n_chunks, first, last = _loud_chunk_bounds(samples, chunk_samples, threshold_sq)
+
+    # Nothing above the threshold: the whole sound is silence
+    if first < 0: return 0, 0
+    chunk_frames = chunk_samples // channels
+    n_frames = len(samples) // channels
+    # The partial chunk at the very end can't be measured, so keep it if the audio is still loud up to there
+    end_frame = n_frames if last == n_chunks - 1 else (last + 1) * chunk_frames
+    return first * chunk_frames, end_frame
+
+def sound_samples(sound):
+    '''
+    Returns the interleaved samples of a pydub AudioSegment as a NumPy array of its own sample width.
+    '''
+    return np.asarray(sound.get_array_of_samples())
 
-    return trim_ms
+def _trim_temp_path(filepath):
+    return filepath.with_name(filepath.stem + '.trimming' + filepath.suffix)
+
+def _trim_one(filepath):
+    '''
+    Trims the silence off both ends of a recording and writes it next to the original.
+    Returns (filepath, temporary filepath) so the caller can swap the files in.
+    '''
+    temp_filepath = _trim_temp_path(filepath)
+
+    params = None
+    if filepath.suffix.lower() == '.wav':
+        try:
+            with wave.open(str(filepath), 'rb') as waveform:
+                params = waveform.getparams()
+                if params.sampwidth == 2 and params.comptype == 'NONE':
+                    raw = waveform.readframes(params.nframes)
+                else:
+                    params = None
+        except wave.Error:
+            # Float and WAVE_FORMAT_EXTENSIBLE files aren't supported by the wave module
+            params = None
+
+    if params is None:
+        # Not plain 16-bit PCM, let ffmpeg handle decoding and encoding
+        audio_format = filepath.suffix.replace('.', '')
+        sound = AudioSegment.from_file(filepath, format=audio_format)
+        samples = sound_samples(sound)
+        start_frame, end_frame = loud_frame_bounds(samples, sound.frame_rate, sound.channels, sound.max_possible_amplitude)
+        trimmed_sound = sound.get_sample_slice(start_frame, end_frame)
+        trimmed_sound.export(temp_filepath, format=audio_format)
+        return filepath, temp_filepath
+
+    # Recordings are uncompressed PCM, so trim the samples directly and keep the original header fields
+    samples = np.frombuffer(raw, dtype=np.int16)
+    start_frame, end_frame = loud_frame_bounds(samples, params.framerate, params.nchannels, 2 ** 15)
+    trimmed = samples[start_frame * params.nchannels:end_frame * params.nchannels]
+
+    with open(temp_filepath, 'wb', buffering=IO_BUFFER_SIZE) as raw_file, wave.open(raw_file, 'wb') as waveform:
+        waveform.setparams(params)
+        waveform.writeframes(trimmed.tobytes())
+    return filepath, temp_filepath
+
+class MMapSource:
+    '''
+    A read-only generator source backed by a memory mapped file.
+    Only the line offsets are kept in memory, lines are decoded when they are sampled.
+    '''
+    # Bytes that str.strip() removes from ASCII text
+    WHITESPACE = np.frombuffer(b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f', dtype=np.uint8)
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.mm = None
+        self.starts = self.ends = np.zeros(0, dtype=np.int64)
+        # Empty files can't be memory mapped
+        if os.fstat(self.file.fileno()).st_size == 0: return
+
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        data = np.frombuffer(self.mm, dtype=np.uint8)
+        newlines = np.flatnonzero(data == 0x0A)
+        starts = np.concatenate(([0], newlines + 1))
+        ends = np.concatenate((newlines, [len(data)]))
+        # Move each line's end back over trailing ASCII whitespace (including the '\r' of Windows line endings),
+        # so that lines which are only whitespace end up empty and are skipped
+        trimming = ends > starts
+        while trimming.any():
+            lines = np.flatnonzero(trimming)
+            is_space = np.isin(data[ends[lines] - 1], self.WHITESPACE)
+            ends[lines[is_space]] -= 1
+            trimming[lines[~is_space]] = False
+            trimming &= ends > starts
+        non_blank = ends > starts
+        self.starts, self.ends = starts[non_blank], ends[non_blank]
+        # Release the buffer export so that the map can be closed later
+        del data
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        return self.mm[self.starts[i]:self.ends[i]].decode('utf8', 'ignore').strip()
+
+    def close(self):
+        if self.mm is not None: self.mm.close()
+        self.file.close()
+
+class TranscriptModel(QAbstractTableModel):
+    '''
+    Table model holding the (recording_id, transcription) rows of the dataset as plain tuples.
+    '''
+    HEADERS = ('Recording', 'Transcription')
+
+    def __init__(self):
+        QAbstractTableModel.__init__(self)
+        self._rows = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole): return None
+        return self._rows[index.row()][index.column()]
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole: return False
+        row = list(self._rows[index.row()])
+        row[index.column()] = value
+        self._rows[index.row()] = tuple(row)
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def flags(self, index):
+        return QAbstractTableModel.flags(self, index) | Qt.ItemIsEditable
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole: return self.HEADERS[section]
+        return QAbstractTableModel.headerData(self, section, orientation, role)
+
+    def rows(self):
+        return list(self._rows)
+
+    def append_rows(self, rows):
+        # A single insertion, however many rows are added
+        if len(rows) == 0: return
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+    def remove_rows(self, indices):
+        # Remove from the bottom up, so that the remaining indices stay valid
+        for i in sorted(set(indices), reverse=True):
+            self.beginRemoveRows(QModelIndex(), i, i)
+            del self._rows[i]
+            self.endRemoveRows()
 
 class Widget(QWidget):
     def __init__(self):
@@ -137,9 +405,10 @@ class Widget(QWidget):
 
 
         # Table panel
-        self.table = QTableWidget()
-        self.table.setColumnCount(2)
-        self.table.setHorizontalHeaderLabels(['Recording', 'Transcription'])
+        self.transcripts = TranscriptModel()
+        self.table = QTableView()
+        self.table.setModel(self.transcripts)
+        self.transcripts.dataChanged.connect(self.on_transcripts_edited)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.table.selectionModel().selectionChanged.connect(self.on_table_selection_changed)
 
@@ -153,15 +422,26 @@ class Widget(QWidget):
         self.setLayout(self.layout)
         self.generate_sentence.clicked.connect(self.on_generate_sentence)
 
-        self.audio_record_timer = QTimer()
-        self.audio_record_timer.timeout.connect(self.on_audio_record_timer_tick)
         self.is_recording = False
+        self.is_finishing_recording = False
 
-        self.AUDIO_TIMER_INTERVAL_MS = 1
+        # ~186 ms per buffer at 22050 Hz, for fewer PortAudio callbacks. Stop keeps recording for one buffer period
+        # so the last, partly filled buffer isn't lost, which means saving starts up to ~240 ms after Stop is clicked
+        self.AUDIO_FRAMES_PER_BUFFER = 4096
+        # Extra time to keep recording after Stop, on top of one buffer period, so the last buffer fills up
+        self.AUDIO_STOP_MARGIN_MS = 50
         self.audio_interface = pyaudio.PyAudio()
         self.audio_stream = None
         self.current_audio_recording_frames = None
 
+        # metadata.csv is kept open for appending new transcriptions, and only rewritten when rows are removed
+        self._csv_fp = None
+        self._csv_path = None
+
+        # Lines of every generator source, plus the running line count, for uniform sampling over all lines
+        self._source_lines = []
+        self._cum_counts = np.zeros(0, dtype=np.int64)
+
     @Slot()
     def on_update_settings(self):
         self.update_settings.setEnabled(False)
@@ -176,26 +456,22 @@ class Widget(QWidget):
         waves_output_directory_path = output_directory_path / 'wavs'
         transcript_file_path = output_directory_path / 'metadata.csv'
         if waves_output_directory_path.exists() and transcript_file_path.exists() and transcript_file_path.is_file():
-            transcription_map = {}
-            with open(transcript_file_path, 'r') as transcript_file:
-                for line in transcript_file.readlines():
-                    recording_id, transcription = map(str.strip, line.split('|'))
-                    transcription_map[str(Path(recording_id))] = transcription
+            transcription_map = read_transcript_map(transcript_file_path)
 
-            files = sorted(glob.glob(str(waves_output_directory_path / '*.wav')), key=natural_keys)
+            files = natural_sorted(wav_entries(waves_output_directory_path))
+            # scandir paths all start with the dataset folder, so slicing it off is enough
+            prefix = str(output_directory_path) + os.sep
             for file in files:
-                recording_id = str(Path(file).relative_to(output_directory_path))
+                recording_id = file[len(prefix):] if file.startswith(prefix) else file
                 # print(recording_id in transcription_map , '*', recording_id, '*', transcription_map)
                 if not recording_id in transcription_map: continue
                 items_to_add.append((recording_id, transcription_map[recording_id]))
 
         # TODO: Move to new folder, if there is any.
-        for i in range(self.table.rowCount()):
+        for i in range(self.transcripts.rowCount()):
             print(self.table.rowAt(i))
 
-        for item in items_to_add:
-            self.add_transcription(*item, recreate_csv=False)
-
+        self.add_transcriptions(items_to_add)
         self.create_transcript_csv()
         self.full_dataset_root_path_label.setText(str(output_directory_path))
 
@@ -213,6 +489,8 @@ class Widget(QWidget):
 
     @Slot()
     def on_generator_source_data_changed(self):
+        self._source_lines = [self.generator_sources.item(i).data(Qt.UserRole) for i in range(self.generator_sources.count())]
+        self._cum_counts = np.cumsum([len(lines) for lines in self._source_lines], dtype=np.int64)
         self.generate_sentence.setEnabled(self.generator_sources.count() != 0)
 
     @Slot()
@@ -229,10 +507,10 @@ class Widget(QWidget):
             filepath = Path(filepath_str)
             if not filepath.exists() or not filepath.is_file(): continue
             item = QListWidgetItem(filepath_str)
-            with open(filepath, 'r', encoding='utf8', errors='ignore') as file:
-                lines = file.readlines()
-
-            if len(lines) == 0: continue
+            lines = MMapSource(filepath)
+            if len(lines) == 0:
+                lines.close()
+                continue
 
             item.setData(Qt.UserRole, lines)
             self.generator_sources.addItem(item)
@@ -251,37 +529,42 @@ class Widget(QWidget):
 
         for item in selected_items:
             self.generator_sources.takeItem(self.generator_sources.row(item))
+            item.data(Qt.UserRole).close()
 
     @Slot()
     def on_table_selection_changed(self, selection):
-        self.remove_sentence.setEnabled(len(self.table.selectedItems()) != 0)
+        self.remove_sentence.setEnabled(len(self.table.selectionModel().selectedIndexes()) != 0)
+
+    @Slot()
+    def on_transcripts_edited(self):
+        # Appending can't change existing rows, so edits, like removals, rewrite the whole CSV
+        self.create_transcript_csv()
 
     @Slot()
     def on_remove_sentence(self):
-        selected_items = self.table.selectedItems()
-        if len(selected_items) == 0:
+        selected_rows = {index.row() for index in self.table.selectionModel().selectedIndexes()}
+        if len(selected_rows) == 0:
             # If the clicked command was called and somehow nothing is selected, something went wrong...
             # Therefore, disable the button so that it doesn't happen again!
             self.remove_sentence.setEnabled(False)
             return
 
-        if len(selected_items) == self.table.rowCount():
+        if len(selected_rows) == self.transcripts.rowCount():
             self.remove_sentence.setEnabled(False)
 
-        for item in selected_items:
-            self.table.removeRow(self.table.indexFromItem(item).row())
+        self.transcripts.remove_rows(selected_rows)
 
         self.create_transcript_csv()
 
     @Slot()
     def on_generate_sentence(self):
-        if self.generator_sources.count() == 0: return
+        if len(self._cum_counts) == 0: return
 
-        # Choose a random source
-        index = random.randint(0, self.generator_sources.count() - 1)
-        widget_item = self.generator_sources.item(index)
-        line = random.choice(widget_item.data(Qt.UserRole)).strip()
-        self.generated_sentence_label.setText(line)
+        # Choose a random line across all sources, so that every line is equally likely
+        i = random.randrange(int(self._cum_counts[-1]))
+        source = bisect_right(self._cum_counts, i)
+        local = i - (int(self._cum_counts[source - 1]) if source else 0)
+        self.generated_sentence_label.setText(self._source_lines[source][local])
         self.check_record_enable()
         
 
@@ -298,70 +581,104 @@ class Widget(QWidget):
             has_dataset_output_directory = output_directory_path.exists() and not output_directory_path.is_file()
 
         has_generated_sentence = self.generated_sentence_label.text()
-        self.record.setEnabled(all([has_dataset_name, has_dataset_output_directory, has_generated_sentence]))
+        is_idle = not self.is_finishing_recording
+        self.record.setEnabled(all([has_dataset_name, has_dataset_output_directory, has_generated_sentence, is_idle]))
 
     @Slot()
     def on_record_clicked(self):
+        if self.is_finishing_recording: return
         self.is_recording = not self.is_recording
         if self.is_recording:
-            self.current_audio_recording_frames = []
-            self.audio_stream = self.audio_interface.open(format=pyaudio.paInt16, channels=1, rate=22050, frames_per_buffer=1024, input=True)
-            self.audio_record_timer.start(self.AUDIO_TIMER_INTERVAL_MS)
+            self.current_audio_recording_frames = bytearray()
+            self.audio_stream = self.audio_interface.open(format=pyaudio.paInt16, channels=1, rate=22050, frames_per_buffer=self.AUDIO_FRAMES_PER_BUFFER, input=True,
+                                                          stream_callback=self.on_audio_stream_callback)
+            self.record.setText('Stop Recording')
         else:
-            # Save the last parts of the audio...
-            self.on_audio_record_timer_tick(force=True)
-            self.audio_stream.stop_stream()
-            self.audio_stream.close()
-            self.audio_record_timer.stop()
-
-            output_directory_path = Path(self.output_directory_label.text()) / self.dataset_name.text()
-            waves_output_directory_path = output_directory_path / 'wavs'
-            if not waves_output_directory_path.exists():
-                waves_output_directory_path.mkdir(parents=True, exist_ok=True)
-
-            new_row_index = self.table.rowCount()
-            destination_file_path = waves_output_directory_path / '{}{}.wav'.format(self.dataset_name.text(), new_row_index + 1)
-            waveform = wave.open(str(destination_file_path), 'wb')
+            # PortAudio never hands a partly filled buffer to the callback, so stopping right away would drop
+            # everything said since the last one. Keep recording for one more buffer period before stopping.
+            self.is_finishing_recording = True
+            self.record.setEnabled(False)
+            self.record.setText('Saving...')
+            buffer_ms = math.ceil(1000 * self.audio_stream._frames_per_buffer / self.audio_stream._rate)
+            QTimer.singleShot(buffer_ms + self.AUDIO_STOP_MARGIN_MS, self.on_finish_recording)
+
+    @Slot()
+    def on_finish_recording(self):
+        self.audio_stream.stop_stream()
+        self.audio_stream.close()
+
+        output_directory_path = Path(self.output_directory_label.text()) / self.dataset_name.text()
+        waves_output_directory_path = output_directory_path / 'wavs'
+        if not waves_output_directory_path.exists():
+            waves_output_directory_path.mkdir(parents=True, exist_ok=True)
+
+        new_row_index = self.transcripts.rowCount()
+        destination_file_path = waves_output_directory_path / '{}{}.wav'.format(self.dataset_name.text(), new_row_index + 1)
+        with open(destination_file_path, 'wb', buffering=IO_BUFFER_SIZE) as raw_file:
+            waveform = wave.open(raw_file, 'wb')
             waveform.setnchannels(self.audio_stream._channels)
             waveform.setsampwidth(self.audio_interface.get_sample_size(self.audio_stream._format))
             waveform.setframerate(self.audio_stream._rate)
-            waveform.writeframes(b''.join(self.current_audio_recording_frames))
+            waveform.writeframes(self.current_audio_recording_frames)
             waveform.close()
-            
-            
-            wavspathout = str(destination_file_path.relative_to(output_directory_path)) #appends wavs/ and .wav to metadata.csv, used in some datasets
-            ljspeechout = wavspathout.replace(".wav", "").replace("wavs/", "") #removes wavs/ and .wav from metadata.csv, used in ljspeech format
-            self.add_transcription(str(ljspeechout), self.generated_sentence_label.text()) #remove ljspeechout with wavspathout to replace format
-
-        self.record.setText('Record Sentence' if not self.is_recording else 'Stop Recording')
-
-    def add_transcription(self, recording_id, transcription, recreate_csv=True):
-        new_row_index = self.table.rowCount()
+        
+        
+        wavspathout = str(destination_file_path.relative_to(output_directory_path)) #appends wavs/ and .wav to metadata.csv, used in some datasets
+        ljspeechout = wavspathout.replace(".wav", "").replace("wavs/", "") #removes wavs/ and .wav from metadata.csv, used in ljspeech format
+        self.add_transcription(str(ljspeechout), self.generated_sentence_label.text()) #remove ljspeechout with wavspathout to replace format
 
-        self.table.insertRow(new_row_index)
-        self.table.setItem(new_row_index, 0, QTableWidgetItem(recording_id))
-        self.table.setItem(new_row_index, 1, QTableWidgetItem(transcription))
+        self.is_finishing_recording = False
+        self.record.setText('Record Sentence')
+        self.check_record_enable()
 
-        if recreate_csv: self.create_transcript_csv()
+    def add_transcription(self, recording_id, transcription, write_csv=True):
+        self.transcripts.append_rows([(recording_id, transcription)])
+
+        if write_csv:
+            csv_file = self.open_transcript_csv()
+            csv_file.write('{}|{}\n'.format(recording_id, transcription))
+            csv_file.flush()
+
+    def add_transcriptions(self, items):
+        '''
+        Adds many (recording_id, transcription) rows at once, without writing them to the CSV.
+        The model announces them with a single insertion, so the view only lays out once.
+        '''
+        self.transcripts.append_rows(items)
+
+    def transcript_csv_path(self):
+        return Path(self.output_directory_label.text()) / self.dataset_name.text() / 'metadata.csv'
+
+    def open_transcript_csv(self):
+        transcript_file_path = self.transcript_csv_path()
+        if self._csv_fp is None or self._csv_path != transcript_file_path:
+            self.close_transcript_csv()
+            self._csv_fp = open(transcript_file_path, 'a', encoding='utf-8', buffering=IO_BUFFER_SIZE, newline='')
+            self._csv_path = transcript_file_path
+        return self._csv_fp
+
+    def close_transcript_csv(self):
+        if self._csv_fp is None: return
+        self._csv_fp.close()
+        self._csv_fp = None
+        self._csv_path = None
 
     def create_transcript_csv(self):
-        transcript_file_path = Path(self.output_directory_label.text()) / self.dataset_name.text() / 'metadata.csv'
-        with open(transcript_file_path, 'w+') as file:
-            for i in range(self.table.rowCount()):
-                recording_id = self.table.item(i, 0).text()
-                transcription = self.table.item(i, 1).text()
-                file.write('{}|{}\n'.format(recording_id, transcription))
-
-    def on_audio_record_timer_tick(self, force=False):
-        if not force and not self.is_recording:
-            self.audio_record_timer.stop()
-            return
-
-        data = self.audio_stream.read(self.audio_stream._frames_per_buffer)
-        self.current_audio_recording_frames.append(data)
+        # Full rewrite, only needed after loading a dataset or removing rows
+        self.close_transcript_csv()
+        rows = ['{}|{}\n'.format(recording_id, transcription) for recording_id, transcription in self.transcripts.rows()]
+        with open(self.transcript_csv_path(), 'w', encoding='utf-8', buffering=IO_BUFFER_SIZE, newline='') as file:
+            file.write(''.join(rows))
+        self.open_transcript_csv()
+
+    def on_audio_stream_callback(self, in_data, frame_count, time_info, status):
+        # Called from PortAudio's thread, bytearray.extend runs under the GIL so no locking is needed
+        self.current_audio_recording_frames.extend(in_data)
+        return (None, pyaudio.paContinue)
 
     @Slot()
     def quit_application(self):
+        self.close_transcript_csv()
         self.audio_interface.terminate()
         QApplication.quit()
 
@@ -402,7 +719,7 @@ class MainWindow(QMainWindow):
     @Slot()
     def on_table_data_changed(self):
         centralWidget = self.centralWidget()
-        self.process_menu.setEnabled(centralWidget.table.rowCount() > 0)
+        self.process_menu.setEnabled(centralWidget.transcripts.rowCount() > 0)
 
     @Slot()
     def new_file(self, checked):
@@ -415,33 +732,45 @@ class MainWindow(QMainWindow):
     @Slot()
     def trim_silence(self, checked):
         centralWidget = self.centralWidget()
-        progress = QProgressDialog('Computing trimmed audio...', 'Cancel', 0, 2 * (centralWidget.table.rowCount() - 1), self)
+        dataset_path = Path(centralWidget.output_directory_label.text()) / centralWidget.dataset_name.text()
+        # Duplicate rows (e.g. from clicking Update twice) must not run two workers on the same temporary file
+        filepaths = list(dict.fromkeys(dataset_path / recording_id for recording_id, _ in centralWidget.transcripts.rows()))
+
+        progress = QProgressDialog('Trimming audio...', 'Cancel', 0, len(filepaths), self)
         progress.setMinimumDuration(0)
         progress.setWindowTitle('Trimming silence...')
         progress.setWindowModality(Qt.WindowModal)
 
-        trimmed_Y = []
-        for i in range(centralWidget.table.rowCount()):
-            progress.setValue(i)
-            if progress.wasCanceled(): return
-
-            recording_id = centralWidget.table.item(i, 0).text()
-            filepath = Path(centralWidget.output_directory_label.text()) / centralWidget.dataset_name.text() / recording_id
-            progress.setLabelText('Computing trimmed audio...{}'.format(recording_id))
-
-            # Trim silence
-            sound = AudioSegment.from_file(filepath, format=filepath.suffix.replace('.', ''))
-            start_trim = detect_leading_silence(sound)
-            end_trim = detect_leading_silence(sound.reverse())
-            trimmed_sound = sound[start_trim:len(sound)-end_trim]
-            trimmed_Y.append((filepath, trimmed_sound))
-
-        # Output
-        for i in range(len(trimmed_Y)):
-            filepath, trimmed_sound = trimmed_Y[i]
-            progress.setValue(len(trimmed_Y) - 1 + i)
-            progress.setLabelText('Saving {}'.format(recording_id))
-            trimmed_sound.export(filepath, format=filepath.suffix.replace('.', ''))
+        # File I/O, NumPy and ffmpeg subprocesses all release the GIL, so threads keep every core busy.
+        # Futures are consumed here on the GUI thread, which is the only place Qt is touched.
+        failed = []
+        try:
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                futures = {executor.submit(_trim_one, filepath): filepath for filepath in filepaths}
+                for i, future in enumerate(as_completed(futures)):
+                    if progress.wasCanceled():
+                        for pending in futures: pending.cancel()
+                        break
+
+                    # A file that fails to trim is left untouched, the others are still swapped in
+                    filepath = futures[future]
+                    try:
+                        _, temp_filepath = future.result()
+                        os.replace(temp_filepath, filepath)
+                    except Exception as e:
+                        failed.append('{}: {}'.format(filepath.name, e))
+                    progress.setValue(i + 1)
+                    progress.setLabelText('Trimmed {}'.format(filepath.name))
+        finally:
+            # The executor has waited for every running job by now, so drop whatever output
+            # was left behind by failed, canceled or unfinished jobs
+            for filepath in filepaths:
+                temp_filepath = _trim_temp_path(filepath)
+                if temp_filepath.exists(): os.remove(temp_filepath)
+
+        progress.setValue(len(filepaths))
+        if failed:
+            QMessageBox.warning(self, 'Trimming silence...', 'Some recordings could not be trimmed:\n' + '\n'.join(failed))
 
 if __name__ == '__main__':
     # Qt Application